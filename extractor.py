@@ -0,0 +1,672 @@
+import hashlib
+import multiprocessing
+import os
+import pickle
+import re
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+
+import fitz
+import numpy as np
+import pandas as pd
+from PIL import Image
+import pytesseract
+
+# Copy-on-Write مفعل دائماً من pandas 3 والخيار نفسه أصبح مهملاً
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.options.mode.copy_on_write = True
+
+# مسار فارغ في PDF2EXCEL_CACHE_DIR يعطل الكاش على القرص
+CACHE_DIR = os.environ.get("PDF2EXCEL_CACHE_DIR", str(Path.home() / ".cache" / "pdf2excel"))
+CACHE_DIR = Path(CACHE_DIR) if CACHE_DIR else None
+# يُرفع عند تغيير منطق الاستخراج حتى لا تُستخدم نتائج قديمة
+CACHE_VERSION = "6"
+# النتائج تحتوي بيانات العملاء ونص الفاتورة كاملاً، فلا نحتفظ بها للأبد ولا نتركها تكبر بلا حد
+CACHE_MAX_AGE = 7 * 24 * 3600
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+ARABIC_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹\u066b", "01234567890123456789.", "\u066c")
+DECIMAL_COMMA_RE = re.compile(r',\d{1,2}$')
+NON_NUMERIC_RE = re.compile(r"[^\d.]")
+
+def clean_number(val):
+    v_str = str(val).strip().translate(ARABIC_DIGITS)
+    
+    # 💡 ذكاء اصطناعي للتعرف على الفاصلة العشرية (مثل 644,00)
+    if DECIMAL_COMMA_RE.search(v_str):
+        v_str = v_str[::-1].replace(',', '.', 1)[::-1]
+        
+    s = NON_NUMERIC_RE.sub("", v_str)
+    
+    try:
+        if len(s.split('.')[0]) > 10:
+            return None
+        return float(s) if s else None
+    except:
+        return None
+
+FILENAME_NUM_RE = re.compile(r"^[-*\s]*\d+[-*\s]*|[-*\s]*\d+[-*\s]*$")
+ARABIC_CHAR_RE = re.compile(r"[\u0600-\u06FF]")
+
+def extract_name_from_filename(pdf_path):
+    stem = Path(pdf_path).stem
+    name = FILENAME_NUM_RE.sub("", stem).strip()
+    if ARABIC_CHAR_RE.search(name):
+        return name
+    return ""
+
+UNIT_WORDS = {
+    "كرتونة", "كرتون", "قطعة", "علبة", "كيس", "طن", "كجم", "لتر", "كغ",
+    "جرام", "مل", "حبة", "رول", "باكيت", "صندوق",
+}
+
+HEADER_KW =["البند", "الوصف", "العدد", "سعر الوحدة", "الكمية", "الوحدة"]
+STOP_KWS =["المجموع", "القيمة المضافة", "الإجمالي", "الإحمالي", "اإلجمالي", "الاجمالي", "الرصيد", "الايبان", "رقم الحساب", "الإإحمالي"]
+SKIP_KWS =["العنوان", "الضريبي", "السجل", "تاريخ", "العميل", "فاكس", "هاتف", "جوال", "إلى", "رقم الفاتورة", "رقم الغاتورة", "الفاتورة", "الغاتورة", "مدفوع", "مرتجع"]
+
+HEADER_RE = re.compile("|".join(map(re.escape, HEADER_KW)))
+STOP_RE = re.compile("|".join(map(re.escape, STOP_KWS)))
+SKIP_RE = re.compile("|".join(map(re.escape, SKIP_KWS)))
+ENGLISH_WORD_RE = re.compile(r'[A-Za-z]{3,}')
+
+TOTALS_RE = re.compile(
+    r'(?:(?P<ta>الإ[جح]مالي|الإإ[جح]مالي|اإلجمالي|الاجمالي|الإجمالي)'
+    r'|(?P<tb>المجموع)'
+    r'|(?P<vat>القيمة المضافة|المضافة|15%))'
+    r'(?=\s*[:\-]?\s*(?P<val>[\d.,]+))'
+)
+
+CUSTOMER_NAME_RE = re.compile(r'اسم العميل\s*:\s*(.*?)(?=رقم|التاريخ|الرقم|ال[غف]اتورة|الفغاتورة|إلى|\n)')
+INVOICE_NUM_RE = re.compile(r'رقم\s*(?:ال[غف]اتورة|الفغاتورة|فاتورة)\s*[:\-]?\s*(\d{4,6})')
+INVOICE_NUM_FALLBACK_RE = re.compile(r'رقم.*?\s+(\d{4,6})\b')
+FILENAME_INV_RE = re.compile(r'(\d{4,6})')
+INVOICE_DATE_RE = re.compile(r'تاريخ.*?\s+(\d{1,2}[/\-]\d{1,2}[/\-]\d{4})')
+ADDRESS_RE = re.compile(
+    r'العنوان\s*:\s*(.+?)(?=\n\s*05|\n\s*\d{10}|\n\s*البند|\n\s*المجموع|05\d{8}'
+    r'|فيل|كبدة|عجل|فخده|فوركوارتر|فيليه|صدور|امامي)',
+    re.DOTALL,
+)
+TRAILING_PHONE_RE = re.compile(r'\s*\d{10}\s*$')
+IBAN_RE = re.compile(r'SA\d{22}')
+LONG_NUMBER_RE = re.compile(r'\b\d{10,}\b')
+DATE_RE = re.compile(r'\d{1,2}[/\-]\d{1,2}[/\-]\d{4}')
+NUMBER_RE = re.compile(r"\b\d+(?:[.,]\d+)*\b")
+
+FINAL_COLS =[
+    "Invoice Number", "Invoice Date", "Customer Name",
+    "Address", "Balance", "Paid",
+    "Total before tax", "VAT 15%", "Total after tax",
+    "Unit price", "Quantity", "Description", "SKU",
+    "Source File",
+]
+
+MONEY_COLS =["Balance", "Paid", "Total before tax", "VAT 15%", "Total after tax", "Unit price"]
+
+ARROW_STRING = "string[pyarrow]"
+META_STRING_COLS =["Invoice Number", "Invoice Date", "Customer Name", "Address", "Source File"]
+# المجاميع قد تكون None، فتُحوّل إلى float حتى لا يصبح العمود object
+META_MONEY_COLS =[c for c in MONEY_COLS if c != "Unit price"]
+
+# 👑 الكتالوج الصارم لتوحيد أسماء المنتجات تماماً
+PRODUCT_CATALOG =[
+    {
+        "keywords":["صاحبة", "SAHIBA"],
+        "sku": "فيل ليج هندي صاحبة 18 ك (510)",
+        "desc": "VEAL LEG SAHIBA"
+    },
+    {
+        "keywords":["الفاروق", "ELFAROUK", "ELFAROK"],
+        "sku": "فيل ليج هندي الفاروق 18 ك",
+        "desc": "VEAL LEG ELFAROUK"
+    },
+    {
+        "keywords":["فوركوارتر", "FOREQUARTER", "FQ", "AMBER"],
+        "sku": "فوركوارتر هندي عمبر",
+        "desc": "FQ FOREQUARTER AMBER"
+    },
+    {
+        "keywords":["كبدة", "LAMBLIVER", "JUNNE"],
+        "sku": "كبدة ضأن استرالي جوني جولد",
+        "desc": "LAMBLIVER JUNNE GOLD"
+    },
+    {
+        "keywords":["عجل مقطع", "BONEINCUT"],
+        "sku": "عجل مقطع افيكو نيوزلاندي",
+        "desc": "BONEINCUT WAY"
+    },
+    {
+        "keywords":["فخده", "WHOLE LEG", "رستم", "RUSTAM"],
+        "sku": "فخده كامله هندي رستم",
+        "desc": "WHOLE LEG RUSTAM"
+    },
+    {
+        "keywords":["فيليه", "TENDERLOIN"],
+        "sku": "فيليه عجل هندي عمبر 18 ك (99)",
+        "desc": "VEAL TENDERLOIN KG"
+    },
+    {
+        "keywords":["صدور", "BREAST", "RUSSIA"],
+        "sku": "صدور دجاج روسي",
+        "desc": "CHICKEN BREAST RUSSIA"
+    },
+    {
+        "keywords":["امامي", "FORESHANK", "استرالي"],
+        "sku": "امامي لامب بالك استرالي",
+        "desc": "FORESHANK AS JLO"
+    }
+]
+
+CATALOG_INDEX =[
+    (kw.upper(), product["sku"], product["desc"])
+    for product in PRODUCT_CATALOG
+    for kw in product["keywords"]
+]
+
+def standardize_product(raw_text):
+    raw_upper = raw_text.upper()
+    for kw, sku, desc in CATALOG_INDEX:
+        if kw in raw_upper:
+            return sku, desc
+    return None, None
+
+ARABIC_BLOCK_RE = re.compile(r"([\u0600-\u06FF][\u0600-\u06FF\s\d\(\)ك]*)")
+ARABIC_WORD_RE = re.compile(r"[\u0600-\u06FF]{2,}")
+BRACKET_CODE_RE = re.compile(r"[\(\)\[\]]\s*\d+\s*[\(\)\[\]]")
+BRACKET_NUM_RE = re.compile(r"[\(\)\[\]]\s*\d+(?:\.\d+)?\s*[\(\)\[\]]")
+DIGITS_RE = re.compile(r"\d+")
+TWO_NUMBERS_RE = re.compile(r"\d\D+\d")
+ENGLISH_TOKEN_RE = re.compile(r"[A-Za-z]{2,}")
+# أرقام من أكواد المنتجات لا تُعامل ككميات
+SKU_NUMS = frozenset({18, 99, 510, 106, 6, 2, 4, 3590, 10, 9, 2026})
+
+def clean_sku(raw_sku):
+    cleaned = raw_sku.replace("|", " ")
+    words =[w for w in cleaned.split() if w not in UNIT_WORDS and (len(w) > 1 or w == "ك")]
+    return " ".join(words).strip()
+
+def extract_sku_from_line(line):
+    ar_block = ARABIC_BLOCK_RE.search(line)
+    raw = ar_block.group(1).strip() if ar_block else ""
+    if not raw:
+        ar_words = ARABIC_WORD_RE.findall(line)
+        raw = " ".join(w for w in ar_words if w not in UNIT_WORDS)
+    for b in BRACKET_CODE_RE.findall(line):
+        b_clean = "(" + DIGITS_RE.search(b).group() + ")"
+        if b_clean not in raw.replace(" ", ""):
+            raw = raw + " " + b_clean
+    return clean_sku(raw)
+
+OCR_WORKERS = 4
+# دقة 200 نقطة لكل بوصة تكفي tesseract لقراءة النص العربي
+OCR_DPI = 200
+
+def render_page(page, dpi=OCR_DPI):
+    pix = page.get_pixmap(dpi=dpi)
+    return Image.frombytes("RGB",[pix.width, pix.height], pix.samples)
+
+def get_text(doc):
+    text = "\n".join(page.get_text() for page in doc).strip()
+    if len(text) > 50:
+        return text, "native", None
+    try:
+        first_page_img = None
+        futures =[]
+        # 💡 tesseract يعمل كعملية خارجية، فتشغيل الصفحات بالتوازي عبر خيوط يكفي
+        with ThreadPoolExecutor(max_workers=OCR_WORKERS) as ex:
+            for i, page in enumerate(doc):
+                # الصفحات بلا محتوى (فواصل فارغة) لا تُرسم ولا تمر على tesseract
+                if not page.get_contents():
+                    futures.append(None)
+                    continue
+                # الرسم يبقى في هذا الخيط (مستند fitz لا يُشارك بين الخيوط) ويتداخل مع OCR الصفحات السابقة
+                img = render_page(page)
+                if i == 0:
+                    first_page_img = img
+                futures.append(ex.submit(pytesseract.image_to_string, img, lang="ara+eng"))
+                # لا نسبق tesseract بأكثر من ضعف عدد الخيوط، فالصورة تُحرر بمجرد انتهاء OCR منها
+                pending =[f for f in futures if f is not None and not f.done()]
+                if len(pending) >= 2 * OCR_WORKERS:
+                    wait(pending, return_when=FIRST_COMPLETED)
+            page_texts =["" if f is None else f.result() for f in futures]
+        ocr_text = "".join(f"\n--- الصفحة {i+1} ---\n{t}\n" for i, t in enumerate(page_texts))
+        # الصفحة الأولى تُعاد مرسومة ليستخدمها get_ocr_words
+        return ocr_text, "ocr", first_page_img
+    except Exception:
+        pass
+    return "", "ocr", None
+
+def get_ocr_words(doc, img=None):
+    if img is None:
+        img = render_page(doc[0])
+    data = pytesseract.image_to_data(
+        img, lang="ara+eng", config="--psm 6",
+        output_type=pytesseract.Output.DATAFRAME,
+    )
+    text = data["text"]
+    keep = (data["conf"] > 30) & text.notna() & (text.astype(str).str.strip() != "")
+    return data[keep]
+
+def reconstruct_table_rows(word_df, y_tolerance=15):
+    if word_df.empty: return[]
+    mid_y = (word_df["top"] + word_df["height"] / 2).to_numpy()
+    left = word_df["left"].to_numpy()
+    texts = word_df["text"].astype(str).to_numpy()
+    # الكلمات مرتبة رأسياً، فكلمات كل سطر نطاق متصل نجده بـ searchsorted
+    order = np.argsort(mid_y, kind="stable")
+    sorted_y = mid_y[order]
+    used = np.zeros(len(word_df), dtype=bool)
+    rows =[]
+    for pos in range(len(word_df)):
+        if used[pos]: continue
+        y = mid_y[pos]
+        lo = np.searchsorted(sorted_y, y - y_tolerance, side="left")
+        hi = np.searchsorted(sorted_y, y + y_tolerance, side="right")
+        members = order[lo:hi]
+        used[members] = True
+        # من اليمين إلى اليسار، بنفس ترتيب sort_values(ascending=False)
+        idx = np.sort(members)[::-1]
+        idx = idx[np.argsort(left[idx])][::-1]
+        rows.append({"y": y, "text": " ".join(texts[idx])})
+    rows.sort(key=lambda r: r["y"])
+    return rows
+
+def get_nums_with_context(segment):
+    # السماح باستخراج الأرقام مع فواصلها لتطبيق القاعدة
+    matches = NUMBER_RE.finditer(segment)
+    res =[]
+    for m in matches:
+        s = m.group(0)
+        v = clean_number(s)
+        if v is not None and v > 0:
+            res.append((s, v))
+    return res
+
+def parse_item_line(line, tb_val=0.0):
+    # 💡 فحص سريع: السطر بدون رقمين منفصلين لا يمكن أن يكون صنفاً
+    if not TWO_NUMBERS_RE.search(line): return None
+
+    line_clean = BRACKET_NUM_RE.sub(" ", line)
+    nums = get_nums_with_context(line_clean)
+    
+    if len(nums) < 2: return None
+
+    # 💡 1. حذف الإجمالي (Row Total) لكي لا يختلط بالكمية أو السعر
+    total_idx_to_remove = -1
+    for i, (s1, v1) in enumerate(nums):
+        for j, (s2, v2) in enumerate(nums):
+            if i >= j: continue
+            for k, (s3, v3) in enumerate(nums):
+                if k == i or k == j: continue
+                if v3 > 0 and abs((v1 * v2) - v3) / v3 < 0.05:
+                    total_idx_to_remove = k
+                    break
+            if total_idx_to_remove != -1: break
+        if total_idx_to_remove != -1: break
+        
+    if total_idx_to_remove != -1:
+        nums.pop(total_idx_to_remove)
+        
+    # حذف المجاميع العامة إذا دخلت في السطر
+    nums = [t for t in nums if t[1] != tb_val]
+    
+    if len(nums) < 1: return None
+
+    qty = None
+    unit_price = None
+
+    decimals = [t for t in nums if '.' in t[0]]
+    integers =[t for t in nums if '.' not in t[0]]
+    
+    # استبعاد أكواد المنتجات من أن تكون كميات
+    integers = [t for t in integers if t[1] not in SKU_NUMS]
+
+    # 💡 2. تطبيق القاعدة الذهبية للأسعار والكميات
+    if decimals:
+        price_idx = decimals[-1][0]
+        unit_price = decimals[-1][1]
+        
+        possible_qtys_before = [t for t in integers if t[0] < price_idx]
+        if possible_qtys_before:
+            qty = possible_qtys_before[-1][1]
+        else:
+            possible_qtys_after = [t for t in integers if t[0] > price_idx]
+            if possible_qtys_after:
+                qty = possible_qtys_after[0][1]
+            elif integers:
+                qty = integers[0][1]
+    else:
+        if len(integers) >= 2:
+            qty = integers[-2][1]
+            unit_price = integers[-1][1]
+        elif nums:
+            qty = nums[0][1]
+            unit_price = nums[0][1]
+
+    if qty is not None:
+        try:
+            qty = int(qty) if float(qty).is_integer() else qty
+        except: pass
+
+    # توحيد اسم المنتج بشكل قاطع باستخدام الكتالوج
+    std_sku, std_desc = standardize_product(line)
+    if std_sku:
+        sku, desc = std_sku, std_desc
+    else:
+        all_eng = ENGLISH_TOKEN_RE.findall(line)
+        desc_words =[w for w in all_eng if len(w) >= 3 or w.isupper()]
+        desc = " ".join(dict.fromkeys(desc_words)).strip()
+        sku = extract_sku_from_line(line)
+
+    if not (sku or desc): return None
+    return {"SKU": sku, "Description": desc, "Quantity": qty, "Unit price": unit_price}
+
+def extract_items_text(text, tb_val):
+    items =[]
+    for line in text.split("\n"):
+        line = line.strip()
+        if not line: continue
+        
+        # 💡 الفحوصات بالترتيب مع خروج مبكر، فكلمات الإنجليزية لا تُفحص إلا في سطور الإجماليات
+        if HEADER_RE.search(line):
+            continue
+
+        if STOP_RE.search(line) and not ENGLISH_WORD_RE.search(line):
+            break
+
+        if SKIP_RE.search(line):
+            continue
+            
+        parsed = parse_item_line(line, tb_val)
+        if parsed and (len(parsed["Description"]) > 2 or len(parsed["SKU"]) > 2):
+            items.append(parsed)
+            
+    return items
+
+def find_vat_pair(values):
+    # 💡 أقرب زوج (قبل الضريبة، بعد الضريبة) لنسبة 1.15
+    unique = np.unique(np.asarray(values, dtype=np.float64))
+    if len(unique) < 2:
+        return None, None
+
+    # القيم مرتبة، فأقرب نسبة لـ 1.15 لكل رقم تقع حول موضع 1.15 × الرقم
+    pos = np.searchsorted(unique, unique * 1.15)
+    cand = np.clip(pos[:, None] + np.arange(-2, 2), 0, len(unique) - 1)
+    ratio = unique[cand] / unique[:, None]
+    diff = np.abs(ratio - 1.15)
+    diff[(ratio < 1.10) | (ratio > 1.20)] = np.inf
+
+    best = np.argmin(diff)
+    if np.isinf(diff.flat[best]):
+        return None, None
+    i, k = np.unravel_index(best, diff.shape)
+    return float(unique[i]), float(unique[cand[i, k]])
+
+def extract_metadata(pdf_path, text):
+    cname = ""
+    m_name = CUSTOMER_NAME_RE.search(text)
+    if m_name:
+        cname = m_name.group(1).strip()
+
+    inv_num = ""
+    m_inv = INVOICE_NUM_RE.search(text)
+    if not m_inv: m_inv = INVOICE_NUM_FALLBACK_RE.search(text)
+    if m_inv: inv_num = m_inv.group(1).strip()
+
+    inv_date = ""
+    m_date = INVOICE_DATE_RE.search(text)
+    if m_date: inv_date = m_date.group(1).strip()
+
+    address = ""
+    m_add = ADDRESS_RE.search(text)
+    if m_add:
+        address = m_add.group(1).replace('\n', ' ').strip()
+        address = TRAILING_PHONE_RE.sub('', address).strip()
+
+    tb = ta = vat = paid = bal = 0.0
+
+    # تنظيف الأرقام البنكية وتواريخ السنين لمنع التشويش على المجاميع
+    safe_text = IBAN_RE.sub('', text)
+    safe_text = LONG_NUMBER_RE.sub('', safe_text)
+    safe_text = DATE_RE.sub('', safe_text)
+
+    totals = {}
+    for m in TOTALS_RE.finditer(safe_text):
+        key = "ta" if m.group("ta") else "tb" if m.group("tb") else "vat"
+        totals.setdefault(key, m.group("val"))
+
+    if "ta" in totals: ta = clean_number(totals["ta"])
+    if "tb" in totals: tb = clean_number(totals["tb"])
+    if "vat" in totals: vat = clean_number(totals["vat"])
+
+    if not ta or not tb:
+        nums_raw =[clean_number(n) for n in NUMBER_RE.findall(safe_text)]
+        nums_raw =[n for n in nums_raw if n is not None and n > 100]
+        
+        best_tb, best_ta = find_vat_pair(nums_raw)
+                        
+        if not tb and best_tb: tb = best_tb
+        if not ta and best_ta: ta = best_ta
+
+    if ta:
+        expected_tb = round(ta / 1.15, 2)
+        expected_vat = round(ta - expected_tb, 2)
+        if not tb or abs(tb - expected_tb) > 2: tb = expected_tb
+        if not vat or abs(vat - expected_vat) > 2: vat = expected_vat
+    elif tb:
+        ta = round(tb * 1.15, 2)
+        vat = round(ta - tb, 2)
+
+    return {
+        "Invoice Number": inv_num,
+        "Invoice Date": inv_date,
+        "Customer Name": cname,
+        "Address": address,
+        "Balance": ta if ta else 0.0,
+        "Paid": 0.0,
+        "Total before tax": tb,
+        "VAT 15%": vat,
+        "Total after tax": ta,
+        "Source File": pdf_path.name,
+    }
+
+def format_invoice_date(value):
+    try:
+        return datetime.strptime(value.replace("-", "/"), "%d/%m/%Y").strftime("%m/%d/%Y")
+    except ValueError:
+        parsed = pd.to_datetime(value, errors="coerce", dayfirst=True)
+        return None if pd.isna(parsed) else parsed.strftime("%m/%d/%Y")
+
+def to_quantity(values):
+    # الكمية عمود Arrow صحيح إلا إذا وُجدت كمية عشرية فعلاً، والقيم الفارغة لا تغير ذلك
+    qty = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce", dtype_backend="pyarrow")
+    if all(float(v).is_integer() for v in qty.dropna()):
+        qty = qty.astype("int64[pyarrow]")
+    return qty
+
+def extract_pdf(pdf_path, pdf_bytes):
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        text, mode, first_page_img = get_text(doc)
+        text = text.translate(ARABIC_DIGITS)
+        meta = extract_metadata(pdf_path, text)
+        tb_val = meta.get("Total before tax", 0.0)
+
+        items = extract_items_text(text, tb_val)
+
+        if not items and mode == "ocr":
+            word_df = get_ocr_words(doc, first_page_img)
+            if not word_df.empty:
+                rows = reconstruct_table_rows(word_df)
+                reconstructed_text = "\n".join([r["text"] for r in rows]).translate(ARABIC_DIGITS)
+                items = extract_items_text(reconstructed_text, tb_val)
+
+    file_cname = extract_name_from_filename(pdf_path)
+    if file_cname and len(file_cname) > 3:
+        meta["Customer Name"] = file_cname
+
+    if not meta["Invoice Number"]:
+        m_fname_inv = FILENAME_INV_RE.search(pdf_path.stem)
+        if m_fname_inv:
+            meta["Invoice Number"] = m_fname_inv.group(1)
+
+    if not items:
+        items =[{"Unit price": None, "Quantity": None, "Description": "", "SKU": ""}]
+
+    meta["Invoice Date"] = format_invoice_date(meta["Invoice Date"])
+    items_df = pd.DataFrame(items).astype({c: ARROW_STRING for c in ("SKU", "Description")})
+    items_df["Unit price"] = pd.to_numeric(items_df["Unit price"], errors="coerce")
+    # من القيم الأصلية وليس من عمود DataFrame، لأن وجود قيمة فارغة واحدة يحوله إلى float64
+    items_df["Quantity"] = to_quantity([i["Quantity"] for i in items])
+    return items_df, meta, mode, text
+
+def prune_cache():
+    # 💡 حذف ملفات الإصدارات القديمة والمنتهية، ثم الأقدم استخداماً حتى يعود الحجم تحت الحد
+    now = time.time()
+    entries =[]
+    for p in CACHE_DIR.iterdir():
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        if p.suffix == ".tmp":
+            # ملف مؤقت متروك من عملية توقفت أثناء الكتابة
+            if now - st.st_mtime > 3600:
+                p.unlink(missing_ok=True)
+        elif p.suffix == ".pkl":
+            if not p.name.startswith(f"v{CACHE_VERSION}-") or now - st.st_mtime > CACHE_MAX_AGE:
+                p.unlink(missing_ok=True)
+            else:
+                entries.append((st.st_mtime, st.st_size, p))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, p in sorted(entries):
+        if total <= CACHE_MAX_BYTES: break
+        p.unlink(missing_ok=True)
+        total -= size
+
+def cache_dir_private():
+    # 💡 pickle.load ينفذ ما في الملف، فلا نقرأ إلا من مجلد نملكه ولا يكتب فيه غيرنا
+    try:
+        st = CACHE_DIR.stat()
+    except OSError:
+        return False
+    if not hasattr(os, "getuid"):
+        return True
+    return st.st_uid == os.getuid() and not st.st_mode & 0o077
+
+def process_pdf(pdf_path, pdf_bytes=None):
+    # pdf_path يحدد اسم الملف فقط، والمحتوى يُقرأ منه إن لم يُمرر جاهزاً
+    pdf_path = Path(pdf_path)
+    if pdf_bytes is None:
+        pdf_bytes = pdf_path.read_bytes()
+    if CACHE_DIR is None:
+        return extract_pdf(pdf_path, pdf_bytes)
+
+    # 💡 النتيجة تعتمد فقط على محتوى الملف واسمه، فنخزنها على القرص بمفتاح sha256
+    digest = hashlib.sha256(CACHE_VERSION.encode())
+    digest.update(pdf_path.name.encode())
+    digest.update(pdf_bytes)
+    cache_path = CACHE_DIR / f"v{CACHE_VERSION}-{digest.hexdigest()}.pkl"
+
+    result = None
+    if cache_dir_private():
+        try:
+            with open(cache_path, "rb") as f:
+                result = pickle.load(f)
+        except Exception:
+            pass
+    if result is not None:
+        # تحديث وقت التعديل عند كل استخدام ليكون الحذف حسب الأقدم استخداماً
+        try:
+            os.utime(cache_path)
+        except OSError:
+            pass
+        return result
+
+    result = extract_pdf(pdf_path, pdf_bytes)
+    # الكاش تحسين فقط، فأي فشل في الكتابة أو التنظيف لا يوقف الاستخراج
+    try:
+        CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        CACHE_DIR.chmod(0o700)
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(result, f)
+            os.replace(tmp_path, cache_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        prune_cache()
+    except Exception:
+        pass
+    return result
+
+# الحجم بعد فك الضغط لكل ملف PDF ولمجموع الملفات في الأرشيف الواحد، فكل المحتوى يبقى في الذاكرة
+MAX_PDF_BYTES = 50 * 1024 * 1024
+MAX_ZIP_BYTES = 500 * 1024 * 1024
+
+def extract_zip_pdfs(zip_file):
+    # 💡 فك ضغط ملفات PDF فقط وبالتوازي عبر خيوط (zlib يحرر الـ GIL أثناء فك الضغط)
+    # zip_file مسار أو ملف مفتوح، والنتيجة أزواج (الاسم، المحتوى) وأزواج (الاسم، الخطأ) للملفات المتجاوزة للحد
+    errors =[]
+    with zipfile.ZipFile(zip_file) as z:
+        members =[]
+        total = 0
+        for info in z.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(".pdf"):
+                continue
+            name = Path(info.filename).name
+            if name.startswith("._"):
+                continue
+            # الحجم من ترويسة الأرشيف قبل القراءة، وzipfile لا يفك أكثر منه
+            if info.file_size > MAX_PDF_BYTES:
+                errors.append((name, f"larger than {MAX_PDF_BYTES // (1024 * 1024)} MB when extracted"))
+            elif total + info.file_size > MAX_ZIP_BYTES:
+                errors.append((name, f"archive exceeds {MAX_ZIP_BYTES // (1024 * 1024)} MB when extracted"))
+            else:
+                total += info.file_size
+                members.append(info)
+        with ThreadPoolExecutor() as ex:
+            contents = list(ex.map(z.read, members))
+    return [(Path(info.filename).name, data) for info, data in zip(members, contents)], errors
+
+def _init_worker():
+    # كل عملية تشغل tesseract بخيط واحد حتى لا تتزاحم العمليات على الأنوية
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+def process_pdf_safe(pdf_path, pdf_bytes=None):
+    try:
+        return process_pdf(pdf_path, pdf_bytes), None
+    except Exception as e:
+        # بعض الأخطاء (مثل MemoryError) بلا رسالة، فنعرض اسم النوع على الأقل
+        return None, str(e) or type(e).__name__
+
+# كل عملية تحمل صور الصفحات في الذاكرة، فنحدد العدد حتى على الأجهزة ذات الأنوية الكثيرة
+MAX_WORKERS = 4
+# 💡 العمليات تُنشأ من خيط سكربت Streamlit بينما خيوط الخادم تعمل، وfork في هذه الحالة قد يعلق
+# العملية الابنة على قفل تمسكه خيوط أخرى، لذلك نستخدم forkserver (أو spawn حيث لا يتوفر)
+MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+def process_pdfs(files):
+    # 💡 كل ملف مستقل، فنوزع الملفات على عمليات منفصلة (وليس خيوط) لتجاوز الـ GIL
+    names = [name for name, _ in files]
+    contents = [data for _, data in files]
+    if len(names) <= 1:
+        return [process_pdf_safe(n, d) for n, d in zip(names, contents)]
+    workers = min(os.cpu_count() or 1, MAX_WORKERS, len(names))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=MP_CONTEXT, initializer=_init_worker) as ex:
+        return list(ex.map(process_pdf_safe, names, contents))
+
+def build_final_df(parts):
+    meta_df = pd.DataFrame([meta for _, meta in parts]).astype(
+        {**{c: ARROW_STRING for c in META_STRING_COLS}, **{c: "float64" for c in META_MONEY_COLS}}
+    )
+    items_df = pd.concat(
+        [items for items, _ in parts], keys=range(len(parts)), names=["_src", None]
+    ).reset_index(level="_src")
+    final_df = items_df.merge(meta_df, left_on="_src", right_index=True, how="left")
+    # الكمية مخزنة كعمود Arrow رقمي في كل ملف، فيبقى صحيحاً بعد الدمج ما لم توجد كمية عشرية
+    return final_df.reindex(columns=FINAL_COLS).reset_index(drop=True)
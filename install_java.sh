@@ -1,3 +0,0 @@
-#!/bin/bash
-apt-get update
-apt-get install -y default-jre